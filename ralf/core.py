@@ -185,6 +185,16 @@ class Ralf:
             if table.is_source():
                 table.pool.broadcast("_next")
 
+    def shutdown(self):
+        """Closes the operators of every table, see Operator.close."""
+        ray.get(
+            [
+                ref
+                for table in self._visit_all_tables()
+                for ref in table.pool.broadcast("close")
+            ]
+        )
+
     def deploy(self, table: Table, name: str):
         # TODO: only execute tables/ops which are deployed
         self.tables[name] = table
@@ -1,30 +1,117 @@
 import asyncio
-import hashlib
 from abc import ABC, abstractmethod
 from collections import OrderedDict, defaultdict
 from concurrent.futures import ThreadPoolExecutor
-from queue import PriorityQueue
+from functools import lru_cache
+import heapq
+import inspect
+import logging
 import random
 import threading
-from typing import Callable, List, Optional
-
+import time
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Union,
+    get_args,
+    get_origin,
+)
+
+import numpy as np
 import psutil
 import ray
+import xxhash
 from ray.actor import ActorHandle
 
 from ralf.policies import load_shedding_policy, processing_policy
 from ralf.state import Record, Schema, TableState, Scope
 
+logger = logging.getLogger()
+
 DEFAULT_STATE_CACHE_SIZE: int = 0
+# Seconds an event worker waits without work before it exits.
+WORKER_IDLE_TIMEOUT_S: float = 60.0
+# Minimum seconds between samples of the process' CPU and memory usage.
+PROCESS_STAT_INTERVAL_S: float = 1.0
+
+
+_UINT64_MASK = (1 << 64) - 1
+
+
+def _hash_key(key) -> int:
+    # Integer keys are already well distributed, skip hashing them. They are
+    # wrapped into the unsigned 64 bit range like the xxhash digests.
+    if isinstance(key, int):
+        return key & _UINT64_MASK
+    if not isinstance(key, str):
+        key = str(key)
+    return xxhash.xxh3_64_intdigest(key.encode("utf-8"))
+
+
+@lru_cache(maxsize=1 << 16, typed=True)
+def _shard_index(key, num_shards: int, rendezvous_hashing: bool) -> int:
+    """Returns the shard a key is routed to.
+
+    Routing is a pure function of its arguments, so hot keys are memoized.
+    """
+    if rendezvous_hashing:
+        # The shard index doubles as the hash seed, so a shard keeps its
+        # weights for every key when other shards are added or removed.
+        key_bytes = str(key).encode("utf-8")
+        return max(
+            range(num_shards),
+            key=lambda i: xxhash.xxh3_64_intdigest(key_bytes, seed=i),
+        )
+    return _hash_key(key) % num_shards
+
+
+def _output_arity(on_record: Callable) -> Optional[str]:
+    """Reads whether `on_record` returns a "single" record or a "list" of them.
+
+    Returns None if the return annotation doesn't say.
+    """
+    annotation = inspect.signature(on_record).return_annotation
+    if get_origin(annotation) is Union:
+        outputs = [arg for arg in get_args(annotation) if arg is not type(None)]
+    else:
+        outputs = [annotation]
+    if len(outputs) != 1:
+        return None
+    if get_origin(outputs[0]) is list:
+        return "list"
+    if outputs[0] is Record:
+        return "single"
+    return None
+
 
 # This should represent a pool of sharded operators.
 class ActorPool:
-    def __init__(self, handles: List[ActorHandle]):
+    """A pool of sharded operator replicas.
+
+    Keys are routed to a shard either by `hash % num_shards`, or, when
+    `rendezvous_hashing` is set, by highest random weight (HRW) hashing. HRW
+    only moves ~1/N of the keys when the number of shards changes, at the cost
+    of hashing each key once per shard.
+    """
+
+    def __init__(self, handles: List[ActorHandle], rendezvous_hashing: bool = False):
         self.handles = handles
+        self.rendezvous_hashing = rendezvous_hashing
         self._lazy = ray.get(handles[0].is_lazy.remote())
 
     @classmethod
-    def make_replicas(cls, num_replicas, actor_class, *init_args, **init_kwargs):
+    def make_replicas(
+        cls,
+        num_replicas,
+        actor_class,
+        *init_args,
+        rendezvous_hashing: bool = False,
+        **init_kwargs,
+    ):
         assert num_replicas > 0
 
         handles = [
@@ -36,15 +123,35 @@ class ActorPool:
         for i, handle in enumerate(handles):
             handle.set_current_actor_handle.remote(handle)
             handle.set_shard_idx.remote(i)
-        return cls(handles)
+        return cls(handles, rendezvous_hashing=rendezvous_hashing)
+
+    def hash_key(self, key) -> int:
+        return _hash_key(key)
+
+    def shard_index(self, key) -> int:
+        return _shard_index(key, len(self.handles), self.rendezvous_hashing)
+
+    def shard_indices(self, keys: List) -> np.ndarray:
+        """Returns the shard index of each key in a batch."""
+        if self.rendezvous_hashing:
+            return np.fromiter(
+                map(self.shard_index, keys), dtype=np.int64, count=len(keys)
+            )
+        hashes = np.fromiter(map(_hash_key, keys), dtype=np.uint64, count=len(keys))
+        return (hashes % np.uint64(len(self.handles))).astype(np.int64)
 
-    def hash_key(self, key: str) -> int:
-        # TODO: Figure out hashing for non-string keys
-        hash_val = hashlib.sha1(key.encode("utf-8")).hexdigest()
-        return int(hash_val, 16)
+    def group_by_shard(self, keys: List) -> Dict[int, np.ndarray]:
+        """Maps each shard index to the positions of the keys routed to it.
+
+        Positions are in increasing order within each shard.
+        """
+        shards = self.shard_indices(keys)
+        order = np.argsort(shards, kind="stable")
+        shard_ids, starts = np.unique(shards[order], return_index=True)
+        return dict(zip(shard_ids.tolist(), np.split(order, starts[1:])))
 
     def choose_actor(self, key) -> ActorHandle:
-        return self.handles[self.hash_key(key) % len(self.handles)]
+        return self.handles[self.shard_index(key)]
 
     # TODO: remove?
     def get(self, key):
@@ -54,6 +161,16 @@ class ActorPool:
     def get_async(self, key) -> ray.ObjectRef:
         return self.choose_actor(key).get.remote(key)
 
+    def get_many_async(self, keys: List) -> List[ray.ObjectRef]:
+        """Queries a batch of keys with one call per shard.
+
+        Each ref resolves to the list of records found on its shard.
+        """
+        return [
+            self.handles[shard_idx].get_many.remote([keys[i] for i in positions])
+            for shard_idx, positions in self.group_by_shard(keys).items()
+        ]
+
     def retract_async(self, key) -> ray.ObjectRef:
         return self.choose_actor(key).retract_key.remote(key)
 
@@ -71,31 +188,66 @@ class ActorPool:
         return self._lazy
 
 
+class _Heap:
+    """A minimal priority queue over heapq.
+
+    Unlike queue.PriorityQueue it does no locking of its own; callers are
+    expected to hold the operator's event condition variable.
+    """
+
+    def __init__(self):
+        self._items = []
+
+    def push(self, item):
+        heapq.heappush(self._items, item)
+
+    def pop(self):
+        return heapq.heappop(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
 class Event:
     """An event corresponding to a record that is processed by the operator.
 
     Orders events according to `processing_policy` if one is provided,
-    otherwise orders events based on record processing time.
+    otherwise orders events based on record processing time. If the policy
+    exposes a sort key (see `processing_policy.with_sort_key`), the key is
+    computed once and comparisons don't call back into the policy.
     """
 
+    __slots__ = ("_operator", "record", "_processing_policy", "_prio")
+
     def __init__(
         self,
-        work: Callable[[], None],
+        operator: "Operator",
         record: Record,
-        processing_policy: Callable[["Event", "Event"], bool],
+        processing_policy: Callable[[Record, Record], bool],
     ):
-        self._work = work
+        self._operator = operator
         self.record = record
         self._processing_policy = processing_policy
+        self._prio = None
+        sort_key = getattr(processing_policy, "key", None)
+        if sort_key is not None:
+            try:
+                self._prio = sort_key(record)
+            except Exception:
+                # e.g. the record lacks the sorted-on field; defer to the
+                # policy, which only fails if this event is actually compared.
+                pass
 
     def __lt__(self, other) -> bool:
-        return self._processing_policy(self.record, other.record)
+        if self._prio is None or other._prio is None:
+            return self._processing_policy(self.record, other.record)
+        return self._prio < other._prio
 
     def __eq__(self, other) -> bool:
-        return self._time == other._time
+        return not (self < other or other < self)
 
     def process(self):
-        self._work()
+        self._operator._on_record_helper(self.record)
 
 
 class Operator(ABC):
@@ -117,6 +269,9 @@ class Operator(ABC):
             processing time.
         load_shedding_policy: decides whether to process the candidate record given that
             the current record is already present in the output table.
+        state_backend: constructs the output table state from the schema, e.g.
+            `functools.partial(RocksDBTableState, block_cache_bytes=...)` to spill
+            the table to disk.
     """
 
     def __init__(
@@ -129,39 +284,71 @@ class Operator(ABC):
         load_shedding_policy: Callable[
             [Record, Record], bool
         ] = load_shedding_policy.always_process,
+        state_backend: Callable[[Schema], TableState] = TableState,
     ):
 
         # Mained output table state
-        self._table = TableState(schema)
+        self._table = state_backend(schema)
         self._cache_size = cache_size
         self._lru = OrderedDict()
         self._lazy = lazy
-        self._events = defaultdict(PriorityQueue)
-        self._empty_queue_event = threading.Event()
+        # Per-key event queues. Only keys with pending events have a queue, so
+        # the keys double as the set of active keys. Queues are only touched
+        # from the actor's event loop; worker coroutines wait on `_events_cv`
+        # and hand the actual processing to the thread pool. Workers are
+        # spawned when events queue up, up to `num_worker_threads`, and exit
+        # after sitting idle for WORKER_IDLE_TIMEOUT_S.
+        self._events = defaultdict(_Heap)
+        self._events_cv: Optional[asyncio.Condition] = None
+        self._num_pending_events = 0
+        self._num_worker_threads = num_worker_threads
+        self._workers: Set[asyncio.Task] = set()
+        self._num_workers = 0
+        self._num_idle_workers = 0
         self._running = True
         self._thread_pool = ThreadPoolExecutor(num_worker_threads)
         self._processing_policy = processing_policy
         self._load_shedding_policy = load_shedding_policy
         self._intra_key_priortization = lambda keys: random.choice(keys)
-        if not self._lazy:
-            for _ in range(num_worker_threads):
-                self._thread_pool.submit(self._worker)
+
+        # Outgoing records buffered per (child pool, shard index). Disabled
+        # unless `set_send_batching` is called with a batch size above 1.
+        self._send_batch_size = 1
+        self._send_batch_timeout_s = 0.0
+        self._send_buffers = defaultdict(list)
+        self._send_lock = threading.Lock()
+        self._send_pending = threading.Event()
+        self._send_flusher: Optional[threading.Thread] = None
 
         # Set scopes
         self._scopes = None
-        self.key_to_parents = defaultdict(list)
-        self.parent_to_keys = defaultdict(list)
+        # Lineage between parent keys and the keys they produced in this table.
+        # Sets, as the same parent key usually re-emits the same output key.
+        self.key_to_parents = defaultdict(set)
+        self.parent_to_keys = defaultdict(set)
 
         # Parent tables (source of updates)
         self._parents = []
         # Child tables (descendants who recieve updates)
         self._children = []
+        # Network optimization: records are only sent to non-lazy children.
+        self._eager_children = []
 
         self._actor_handle = None
         self._shard_idx = 0
 
         self.proc = psutil.Process()
+        # Primes cpu_percent(), whose first call always returns 0.
         self.proc.cpu_percent()
+        self._last_process_stat = None
+        self._last_process_stat_time = float("-inf")
+
+        # Skip checking the shape of on_record's output when it's annotated.
+        output_arity = _output_arity(self.on_record)
+        if output_arity == "single":
+            self._on_record_helper = self._on_record_helper_single
+        elif output_arity == "list":
+            self._on_record_helper = self._on_record_helper_list
 
 
     def set_scopes(self, scopes): 
@@ -175,14 +362,32 @@ class Operator(ABC):
         self._intra_key_priortization_obj = policy_cls(*args, **kwargs)
         self._intra_key_priortization = self._intra_key_priortization_obj.choose
 
+    def set_send_batching(self, batch_size: int, timeout_s: float = 0.001):
+        """Batches records sent to each child shard.
+
+        A batch is sent once it holds `batch_size` records, or `timeout_s`
+        seconds after records start accumulating, whichever comes first.
+        """
+        self._send_batch_size = batch_size
+        self._send_batch_timeout_s = timeout_s
+        if batch_size > 1 and self._send_flusher is None:
+            self._send_flusher = threading.Thread(
+                target=self._flush_sends_periodically, daemon=True
+            )
+            self._send_flusher.start()
+
     def set_shard_idx(self, shard_idx: int):
         self._shard_idx = shard_idx
 
     def _process_stat(self):
-        return {
-            "cpu_percent": self.proc.cpu_percent(),
-            "memory_mb": self.proc.memory_info().rss / (1024 * 1024),
-        }
+        now = time.monotonic()
+        if now - self._last_process_stat_time >= PROCESS_STAT_INTERVAL_S:
+            self._last_process_stat = {
+                "cpu_percent": self.proc.cpu_percent(),
+                "memory_mb": self.proc.memory_info().rss / (1024 * 1024),
+            }
+            self._last_process_stat_time = now
+        return self._last_process_stat
 
     def debug_state(self):
         return {
@@ -191,30 +396,77 @@ class Operator(ABC):
             "cache_size": self._cache_size,
             "lazy": self._lazy,
             "thread_pool_size": self._thread_pool._max_workers,
-            "queue_size": sum([v.qsize() for v in self._events.values()]),
-            "key_queue_size": {k: v.qsize() for k, v in self._events.items()},
+            "num_threads": len(self._thread_pool._threads),
+            "num_workers": self._num_workers,
+            "queue_size": self._num_pending_events,
+            "key_queue_size": {k: len(v) for k, v in self._events.items()},
         }
 
-    def _worker(self):
-        """Continuously processes events."""
-        while self._running:
-            non_empty_queues = [k for k, v in self._events.items() if v.qsize() > 0]
-            if len(non_empty_queues) == 0:
-                self._empty_queue_event.wait()
-                continue
-            chosen_key = self._intra_key_priortization(non_empty_queues)
-            event = self._events[chosen_key].get()
-            self._empty_queue_event.clear()
-            if self._table.schema is not None:
-                key = getattr(event.record, self._table.schema.primary_key)
+    def _spawn_worker(self):
+        # A worker counts as idle until it picks up its first event.
+        self._num_workers += 1
+        self._num_idle_workers += 1
+        task = asyncio.ensure_future(self._worker())
+        # Hold a reference so the task isn't garbage collected while running.
+        self._workers.add(task)
+        task.add_done_callback(self._workers.discard)
+
+    async def _worker(self):
+        """Processes events until idle for WORKER_IDLE_TIMEOUT_S."""
+        loop = asyncio.get_event_loop()
+        self._num_idle_workers -= 1
+        try:
+            while self._running:
+                async with self._events_cv:
+                    while self._num_pending_events == 0:
+                        self._num_idle_workers += 1
+                        try:
+                            await asyncio.wait_for(
+                                self._events_cv.wait(), WORKER_IDLE_TIMEOUT_S
+                            )
+                        except asyncio.TimeoutError:
+                            if self._num_pending_events == 0:
+                                return
+                        finally:
+                            self._num_idle_workers -= 1
+                    event = self._pop_event()
                 try:
-                    current_record = self._table.point_query(key)
-                    if self._load_shedding_policy(event.record, current_record):
-                        event.process()
-                except KeyError:
+                    await loop.run_in_executor(
+                        self._thread_pool, self._process_event, event
+                    )
+                except Exception:
+                    logger.exception("Exception while processing %s", event.record)
+        finally:
+            self._num_workers -= 1
+
+    def _pop_event(self) -> Event:
+        keys = list(self._events)
+        try:
+            chosen_key = self._intra_key_priortization(keys)
+        except Exception:
+            logger.exception("Intra-key prioritization failed, using the oldest key")
+            chosen_key = keys[0]
+        if chosen_key not in self._events:
+            logger.error("Intra-key prioritization chose idle key %s", chosen_key)
+            chosen_key = keys[0]
+        key_events = self._events[chosen_key]
+        event = key_events.pop()
+        if len(key_events) == 0:
+            del self._events[chosen_key]
+        self._num_pending_events -= 1
+        return event
+
+    def _process_event(self, event: Event):
+        if self._table.schema is not None:
+            key = getattr(event.record, self._table.schema.primary_key)
+            try:
+                current_record = self._table.point_query(key)
+                if self._load_shedding_policy(event.record, current_record):
                     event.process()
-            else:
+            except KeyError:
                 event.process()
+        else:
+            event.process()
 
     #@abstractmethod
     #def delete_record(self, record: Record):
@@ -229,22 +481,58 @@ class Operator(ABC):
     def on_delete_record(self, record: Record): 
         return "NOT_IMPLEMENTED"
 
-    def _delete_record_tree(root_key): 
-
-        self._table.delete(root_key)
+    def _delete_record_tree(self, root_key):
+        """Deletes a key and every key derived from it in this table.
 
-        # TODO: get child keys (what was written in current table from that key) from parent_key
-        keys = []
-
-        # delete records in children 
-        for key in keys: 
-            self._table.delete(key) # TODO: when to delete? 
-            child.choose_actor(key).evict.remote(key)
-   
+        Derived keys are found through the parent-to-key lineage and are also
+        evicted from the children and removed from the lineage and LRU. Each
+        key is visited once, so lineages that fan back in (or cycle) don't
+        trigger repeated evictions.
+        """
+        stack = [root_key]
+        visited = set()
+        while stack:
+            key = stack.pop()
+            if key in visited:
+                continue
+            visited.add(key)
 
-    def on_records(self, records: List[Record]): 
-        for record in records: 
-            self._on_record(record)
+            self._table.delete(key)
+            self._lru.pop(key, None)
+            for child in self._children:
+                child.choose_actor(key).evict.remote(key)
+
+            # Unlink the key from the lineage, so that later retractions of
+            # its parents don't look it up again.
+            for parent_key in self.key_to_parents.pop(key, ()):
+                derived_keys = self.parent_to_keys.get(parent_key)
+                if derived_keys is not None:
+                    derived_keys.discard(key)
+                    if not derived_keys:
+                        del self.parent_to_keys[parent_key]
+            stack.extend(self.parent_to_keys.pop(key, ()))
+
+    def on_records(self, records: Iterable[Record], key=None) -> Optional[Record]:
+        """Recomputes an output record from all of its parent records.
+
+        Used to rebuild a record after a retraction, only considering outputs
+        with key `key` if it's given. By default each record goes through
+        `on_record` and the output of the most recently processed parent
+        record is kept, so the result doesn't depend on the order parents
+        respond in. Operators that can reduce incrementally should override
+        this.
+        """
+        result = None
+        for record in sorted(
+            records, key=lambda record: (record.processing_time, _hash_key(record.key))
+        ):
+            output = self.on_record(record)
+            for output_record in output if isinstance(output, list) else [output]:
+                if output_record is None:
+                    continue
+                if key is None or output_record.key == key:
+                    result = output_record
+        return result
 
     def retract_key(self, key) -> ray.ObjectRef:
         """ Retract data from current table
@@ -275,7 +563,8 @@ class Operator(ABC):
         """
        
         # get keys affected by parent record
-        keys = self.parent_to_keys[deleted_parent_record.key]
+        # (copied, as workers may add lineage while this coroutine awaits)
+        keys = list(self.parent_to_keys.get(deleted_parent_record.key, ()))
 
         for key in keys: 
    
@@ -286,20 +575,35 @@ class Operator(ABC):
             if not isinstance(record, Record) or record is None: 
 
                 # determine keys dependent on upstream parent record
-                parent_keys = self.key_to_parents[key]
-
-                # get required parent inputs 
-                parent_records = await asyncio.gather(
-                    *[parent.get_async(key) for parent in self.get_parents() for key in parent_keys],
-                    return_exceptions=True
-                )
-
-                # filter out exceptions/missing records
-                parent_records = [rec for rec in parent_records if isinstance(rec, Record)]
+                parent_keys = list(self.key_to_parents[key])
+
+                # collect parent inputs as each parent shard responds, failing
+                # fast, then recompute off the event loop as on_records runs
+                # user code
+                loop = asyncio.get_event_loop()
+                fetches = [
+                    asyncio.ensure_future(ref)
+                    for parent in self.get_parents()
+                    for ref in parent.get_many_async(parent_keys)
+                ]
+                try:
+                    parent_records = []
+                    for shard_records in asyncio.as_completed(fetches):
+                        parent_records.extend(await shard_records)
+                    record = await loop.run_in_executor(
+                        self._thread_pool, self.on_records, parent_records, key
+                    )
+                except Exception:
+                    # Leave the key as is rather than committing a record
+                    # rebuilt from partial inputs.
+                    logger.exception("Failed to recompute %s, skipping it", key)
+                    for fetch in fetches:
+                        fetch.cancel()
+                    await asyncio.gather(*fetches, return_exceptions=True)
+                    continue
 
                 # TODO: (Sarah) this seems like it'd result in duplicate computation? 
                 # for each parent deletion we're processing seperately that all affect the same child
-                record = self.on_records(parent_records)
 
 
             # assert that updated record has same key as you'd expect would be affected
@@ -318,26 +622,61 @@ class Operator(ABC):
     def _on_record_helper(self, record: Record):
         result = self.on_record(record)
 
-        self.key_to_parents[result.key].append(record.key)
-        self.parent_to_keys[record.key].append(result.key)
-
         if result is not None:
             if isinstance(result, list):  # multiple output values
                 for res in result:
+                    self._add_lineage(record, res)
                     self.send(res)
             else:
+                self._add_lineage(record, result)
                 self.send(result)
 
+    def _on_record_helper_single(self, record: Record):
+        result = self.on_record(record)
+        if result is not None:
+            self._add_lineage(record, result)
+            self.send(result)
+
+    def _on_record_helper_list(self, record: Record):
+        result = self.on_record(record)
+        if result is not None:
+            for res in result:
+                self._add_lineage(record, res)
+                self.send(res)
+
+    def _add_lineage(self, parent_record: Record, record: Record):
+        self.key_to_parents[record.key].add(parent_record.key)
+        self.parent_to_keys[parent_record.key].add(record.key)
+
     async def _on_record(self, record: Record):
-        print("create event", record)
-        event = Event(
-            lambda: self._on_record_helper(record), record, self._processing_policy
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("create event %s", record)
+        if self._events_cv is None:
+            # Created lazily, as the actor's event loop isn't running yet when
+            # the operator is constructed.
+            self._events_cv = asyncio.Condition()
+        event = Event(self, record, self._processing_policy)
         key = record.entries[self._table.schema.primary_key]
-        self._events[key].put(event)
-        self._empty_queue_event.set()
-
-    def send(self, record: Record):
+        async with self._events_cv:
+            self._events[key].push(event)
+            self._num_pending_events += 1
+            self._events_cv.notify()
+            if (
+                not self._lazy
+                and self._num_pending_events > self._num_idle_workers
+                and self._num_workers < self._num_worker_threads
+            ):
+                self._spawn_worker()
+
+    async def _on_records(self, records: List[Record]):
+        for record in records:
+            await self._on_record(record)
+
+    def _update_record(self, record: Record):
+        """Writes a record produced by this operator to the output table.
+
+        Returns the record's primary key.
+        """
         key = getattr(record, self._table.schema.primary_key)
         # TODO: Log record/result
         #with open(
@@ -350,12 +689,11 @@ class Operator(ABC):
         # update state table
         self._table.update(record)
 
-        # TODO(peter): move eviction code to an update_record function,
-        # as the table may change lazily.
         if self._cache_size > 0:
-            self._lru.pop(key, None)
-            self._lru[key] = key
-            self._table.update(record)
+            try:
+                self._lru.move_to_end(key)
+            except KeyError:
+                self._lru[key] = None
 
             if len(self._lru) > self._cache_size:
                 evict_key = self._lru.popitem(last=False)[0]
@@ -366,11 +704,80 @@ class Operator(ABC):
                     child.choose_actor(evict_key).evict.remote(evict_key)
 
         record._source = self._actor_handle
-        # Network optimization: only send to non-lazy children.
+        return key
+
+    def send(self, record: Record):
+        key = self._update_record(record)
         # TODO: Add filter to check scopes
-        for child in filter(lambda c: not c.is_lazy(), self._children):
-            print("sending", key, record)
-            child.choose_actor(key)._on_record.remote(record)
+        if self._eager_children and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("sending %s %s", key, record)
+        for child in self._eager_children:
+            if self._send_batch_size > 1:
+                self._buffer_send(child, child.shard_index(key), record)
+            else:
+                child.choose_actor(key)._on_record.remote(record)
+
+    def send_many(self, records: List[Record]):
+        """Sends a batch of records with one call per child shard.
+
+        Operators overriding `send` get one `send` call per record instead. If
+        send batching is enabled, records are buffered the same way `send`
+        buffers them.
+        """
+        if type(self).send is not Operator.send:
+            for record in records:
+                self.send(record)
+            return
+        keys = [self._update_record(record) for record in records]
+        if self._eager_children and logger.isEnabledFor(logging.DEBUG):
+            for key, record in zip(keys, records):
+                logger.debug("sending %s %s", key, record)
+        for child in self._eager_children:
+            if self._send_batch_size > 1:
+                for key, record in zip(keys, records):
+                    self._buffer_send(child, child.shard_index(key), record)
+                continue
+            for shard_idx, positions in child.group_by_shard(keys).items():
+                child.handles[shard_idx]._on_records.remote(
+                    [records[i] for i in positions]
+                )
+
+    # Batches are submitted while holding `_send_lock`, so that batches for the
+    # same child shard are submitted in the order their records were sent.
+    def _buffer_send(self, child: ActorPool, shard_idx: int, record: Record):
+        with self._send_lock:
+            buffer = self._send_buffers[(child, shard_idx)]
+            buffer.append(record)
+            if len(buffer) < self._send_batch_size:
+                self._send_pending.set()
+                return
+            del self._send_buffers[(child, shard_idx)]
+            child.handles[shard_idx]._on_records.remote(buffer)
+
+    def _flush_sends(self):
+        with self._send_lock:
+            for (child, shard_idx), records in self._send_buffers.items():
+                child.handles[shard_idx]._on_records.remote(records)
+            self._send_buffers = defaultdict(list)
+
+    def _flush_sends_periodically(self):
+        while self._running:
+            self._send_pending.wait()
+            time.sleep(self._send_batch_timeout_s)
+            self._send_pending.clear()
+            self._flush_sends()
+
+    def close(self):
+        """Stops processing and releases the operator's resources.
+
+        Flushes batched sends and closes the output table, e.g. removing the
+        temporary directory of a RocksDB table. Ray doesn't run finalizers
+        when it kills actors, so this has to be called before.
+        """
+        self._running = False
+        self._flush_sends()
+        self._thread_pool.shutdown()
+        self._table.close()
 
     def evict(self, key: str):
         self._table.delete(key)
@@ -381,6 +788,7 @@ class Operator(ABC):
 
     def set_children(self, children: List[ActorPool]):
         self._children = children
+        self._eager_children = [child for child in children if not child.is_lazy()]
 
     def get_children(self) -> List[ActorPool]:
         return self._children
@@ -419,6 +827,25 @@ class Operator(ABC):
         record = self._table.point_query(key)
         return record
 
+    async def get_many(self, keys: List) -> List[Record]:
+        """Queries a batch of keys, skipping keys that aren't found.
+
+        Any other error, e.g. from a lazy operator recomputing a key, fails the
+        whole batch, so callers never mistake a partial result for a complete
+        one.
+        """
+        results = await asyncio.gather(
+            *[self.get(key) for key in keys], return_exceptions=True
+        )
+        records = []
+        for result in results:
+            if isinstance(result, KeyError):
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            records.append(result)
+        return records
+
     def get_all(self):
         # TODO: Generate missing values
         return self._table.bulk_query()
@@ -28,11 +28,7 @@ class Source(Operator, ABC):
                 if not isinstance(e, StopIteration):
                     traceback.print_exc()
                 return
-            # TODO(peter): optimize by adding batch send.
-            for record in records:
-                # assert isinstance(record, Record) # make sure record is a Record object
-                print("sending", record)
-                self.send(record)
+            self.send_many(records)
             # Yield the coroutine so it can be queried.
             await asyncio.sleep(0)
 
@@ -1,22 +1,43 @@
-from typing import Dict
+from typing import Any, Callable, Dict
 
 from ralf.state import Record
 
 
+def with_sort_key(key: Callable[[Record], Any]):
+    """Attaches a sort key to a processing policy.
+
+    `policy(first, second)` must be equivalent to `key(first) < key(second)`.
+    Operators evaluate the key once per record instead of calling the policy
+    on every comparison.
+    """
+
+    def decorate(policy):
+        policy.key = key
+        return policy
+
+    return decorate
+
+
+@with_sort_key(lambda record: record.processing_time)
 def fifo(first: Record, second: Record):
     return first.processing_time < second.processing_time
 
 
+@with_sort_key(lambda record: -record.processing_time)
 def lifo(first: Record, second: Record):
     return first.processing_time > second.processing_time
 
 
+@with_sort_key(lambda record: -record.complete_time)
 def last_completed(first: Record, second: Record):
     return first.complete_time > second.complete_time
 
 
 def make_sorter_with_key_weights(key_to_prority_map: Dict[str, int]):
-    """Lower priority value == more prioritized"""
+    """Lower priority value == more prioritized
+
+    No sort key is attached, as the map may change while events are queued.
+    """
 
     def rank_using_state_context(first: Record, second: Record):
         return key_to_prority_map[first.key] < key_to_prority_map[second.key]
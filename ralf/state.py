@@ -1,5 +1,8 @@
+import numbers
+import pickle
+import tempfile
 import time
-from typing import Any, Dict, List, Type
+from typing import Any, Dict, List, Optional, Type
 
 
 class Scope: 
@@ -103,3 +106,94 @@ class TableState:
 
     def bulk_query(self) -> List[Record]:
         return list(self.records.values())
+
+    def close(self):
+        pass
+
+
+class RocksDBTableState(TableState):
+    """Table state stored in an embedded RocksDB database.
+
+    Recently read blocks are kept in an in-memory LRU block cache of
+    `block_cache_bytes`, the rest of the table spills to disk. Requires
+    `rocksdict`. Without a `path`, the database lives in a temporary directory
+    that is removed on `close()`, which `Operator.close` calls.
+
+    Like dict keys, built-in and numpy numeric keys that compare equal (e.g.
+    `1`, `1.0`, `True` and `np.int64(1)`) address the same record.
+    """
+
+    def __init__(
+        self,
+        schema: Schema,
+        path: Optional[str] = None,
+        block_cache_bytes: int = 64 * 1024 * 1024,
+    ):
+        from rocksdict import BlockBasedOptions, Cache, Options, Rdict
+
+        super().__init__(schema)
+        self._tmp_dir = None
+        if path is None:
+            self._tmp_dir = tempfile.TemporaryDirectory(prefix="ralf-")
+            path = self._tmp_dir.name
+        self.path = path
+
+        self._options = Options(raw_mode=True)
+        self._options.create_if_missing(True)
+        self._options.enable_statistics()
+        table_options = BlockBasedOptions()
+        table_options.set_block_cache(Cache(block_cache_bytes))
+        self._options.set_block_based_table_factory(table_options)
+        self.db = Rdict(path, self._options)
+
+    def _encode_key(self, key) -> bytes:
+        if isinstance(key, numbers.Integral):
+            key = int(key)
+        elif isinstance(key, numbers.Real) and float(key) == key:
+            key = float(key)
+            if key.is_integer():
+                key = int(key)
+        return pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _ticker(self, name: str) -> int:
+        prefix = f"rocksdb.{name} COUNT : "
+        for line in self._options.get_statistics().splitlines():
+            if line.startswith(prefix):
+                return int(line[len(prefix) :])
+        return 0
+
+    def debug_state(self):
+        state = super().debug_state()
+        state["num_records"] = self.db.property_int_value("rocksdb.estimate-num-keys")
+        hits = self._ticker("block.cache.hit")
+        misses = self._ticker("block.cache.miss")
+        lookups = hits + misses
+        state["block_cache_hit_rate"] = hits / lookups if lookups else 0.0
+        return state
+
+    def update(self, record: Record):
+        key = getattr(record, self.schema.primary_key)
+        self.db.put(
+            self._encode_key(key),
+            pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL),
+        )
+        self.num_updates += 1
+
+    def delete(self, key: str):
+        self.db.delete(self._encode_key(key))
+        self.num_deletes += 1
+
+    def point_query(self, key) -> Record:
+        value = self.db.get(self._encode_key(key))
+        if value is None:
+            raise KeyError(f"Key {key} not found.")
+        return pickle.loads(value)
+
+    def bulk_query(self) -> List[Record]:
+        return [pickle.loads(value) for value in self.db.values()]
+
+    def close(self):
+        self.db.close()
+        if self._tmp_dir is not None:
+            self._tmp_dir.cleanup()
+            self._tmp_dir = None
@@ -32,6 +32,7 @@ class Table:
         if "num_replicas" in operator_kwargs:
             self.num_replicas = operator_kwargs["num_replicas"]
             del operator_kwargs["num_replicas"]
+        rendezvous_hashing = operator_kwargs.pop("rendezvous_hashing", False)
 
         if not isinstance(operator, ActorClass):
             operator = ray.remote(operator)
@@ -41,7 +42,11 @@ class Table:
         self.args = operator_args
         self.kwargs = operator_kwargs
         self.pool = ActorPool.make_replicas(
-            self.num_replicas, operator, *operator_args, **operator_kwargs
+            self.num_replicas,
+            operator,
+            *operator_args,
+            rendezvous_hashing=rendezvous_hashing,
+            **operator_kwargs,
         )
         self.pool.broadcast("set_parents", [parent.pool for parent in parents])
         self.parents = parents
@@ -61,6 +66,10 @@ class Table:
         )
         return self
 
+    def set_send_batching(self, batch_size: int, timeout_s: float = 0.001):
+        self.pool.broadcast("set_send_batching", batch_size, timeout_s)
+        return self
+
     def set_scopes(self, scopes: Scope): 
         self.pool.broadcast(
             "set_scopes", scopes
@@ -48,6 +48,18 @@ class Sink(Operator):
         return None
 
 
+@ray.remote
+class Identity(Operator):
+    def __init__(self):
+        super().__init__(
+            schema=Schema("key", {"key": str, "value": int}),
+            cache_size=DEFAULT_STATE_CACHE_SIZE,
+        )
+
+    def on_record(self, record: Record) -> Optional[Record]:
+        return Record(key=record.key, value=record.value)
+
+
 @ray.remote
 class SlowNoop(Operator):
     def __init__(
@@ -94,6 +106,26 @@ def test_mapper():
     assert sorted(values) == list(range(1, 101))
 
 
+def test_send_batching():
+    ralf = Ralf()
+
+    queue = Queue()
+    # send 1 to 100, which doesn't fill the last batch
+    # sources send through send_many, which has to honor batching too
+    source_table = Table([], CounterSource, 100).set_send_batching(8)
+    identity = source_table.map(Identity).set_send_batching(8)
+    sink = identity.map(Sink, queue)
+
+    ralf.deploy(source_table, "source")
+    ralf.deploy(sink, "sink")
+
+    ralf.run()
+
+    records: List[Record] = [queue.get(timeout=10) for _ in range(100)]
+    values = [record.value for record in records]
+    assert sorted(values) == list(range(1, 101))
+
+
 def test_processing_policy():
     ralf = Ralf()
 
@@ -0,0 +1,528 @@
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import List, Optional
+
+import pytest
+
+import ralf.operator
+from ralf.operator import ActorPool, Event, Operator
+from ralf.policies import processing_policy
+from ralf.state import Record, Schema
+
+
+class Emit(Operator):
+    """Emits whatever `outputs` maps the record value to, and keeps what it sent."""
+
+    def __init__(self, outputs):
+        super().__init__(Schema("key", {"value": int}))
+        self.outputs = outputs
+        self.sent = []
+
+    def on_record(self, record):
+        return self.outputs[record.value]
+
+    def send(self, record: Record):
+        self.sent.append(record)
+
+
+class EmitSingle(Emit):
+    def on_record(self, record) -> Optional[Record]:
+        return self.outputs[record.value]
+
+
+class EmitList(Emit):
+    def on_record(self, record) -> List[Record]:
+        return self.outputs[record.value]
+
+
+def test_event_sort_key():
+    first = Event(None, Record(key="a"), processing_policy.fifo)
+    second = Event(None, Record(key="a"), processing_policy.fifo)
+    assert first._prio == first.record.processing_time
+    assert first < second or first == second
+    assert not second < first or first == second
+
+
+def test_event_sort_key_fallback():
+    # Computing the key fails without `complete_time`, which must not fail
+    # the event; the policy is used when it's compared instead.
+    policy = processing_policy.last_completed
+    missing = Event(None, Record(key="a"), policy)
+    assert missing._prio is None
+    done = Event(None, Record(key="a", complete_time=2.0), policy)
+    later = Event(None, Record(key="a", complete_time=3.0), policy)
+    assert later < done
+    with pytest.raises(AttributeError):
+        missing < done
+
+    weights = {"x": 1}
+    policy = processing_policy.make_sorter_with_key_weights(weights)
+    x = Event(None, Record(key="x"), policy)
+    y = Event(None, Record(key="y"), policy)
+    # Weights are read when events are compared, so later updates apply.
+    weights["y"] = 0
+    assert y < x
+
+
+class Collect(Operator):
+    """Keeps the values of the records it processes, in processing order."""
+
+    def __init__(self, **kwargs):
+        super().__init__(Schema("key", {"value": int}), **kwargs)
+        self.seen = []
+
+    def on_record(self, record) -> Optional[Record]:
+        self.seen.append(record.value)
+
+
+def make_records(keys, values):
+    records = []
+    for i, (key, value) in enumerate(zip(keys, values)):
+        record = Record(key=key, value=value)
+        # distinct processing times, as time.time() may not tick between records
+        record.processing_time = float(i)
+        records.append(record)
+    return records
+
+
+async def wait_until(predicate, timeout_s=5.0):
+    deadline = time.monotonic() + timeout_s
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.parametrize(
+    "policy,expected",
+    [(processing_policy.fifo, [0, 1, 2, 3]), (processing_policy.lifo, [3, 2, 1, 0])],
+)
+def test_worker_order(policy, expected):
+    async def run():
+        operator = Collect(num_worker_threads=1, processing_policy=policy)
+        assert operator._events_cv is None
+        # Events are queued before the worker gets to run.
+        for record in make_records("aaaa", range(4)):
+            await operator._on_record(record)
+        assert operator._events_cv is not None
+        await wait_until(lambda: len(operator.seen) == 4)
+        return operator
+
+    operator = asyncio.run(run())
+    assert operator.seen == expected
+    # drained keys don't keep an empty queue around
+    assert dict(operator._events) == {}
+    assert operator._num_pending_events == 0
+
+
+def test_worker_scaling():
+    release = threading.Event()
+
+    class Blocking(Collect):
+        def on_record(self, record) -> Optional[Record]:
+            release.wait()
+            super().on_record(record)
+
+    async def run():
+        operator = Blocking(num_worker_threads=3)
+        await operator._on_record(make_records("a", [0])[0])
+        assert operator._num_workers == 1
+        for record in make_records("bcdefg", range(1, 7)):
+            await operator._on_record(record)
+        # one worker per pending event, up to num_worker_threads
+        assert operator._num_workers == 3
+        assert len(operator._workers) == 3
+        # each worker holds one event in the thread pool
+        await wait_until(lambda: operator._num_pending_events == 4)
+        assert len(operator._events) == 4
+        release.set()
+        await wait_until(lambda: len(operator.seen) == 7)
+        assert dict(operator._events) == {}
+        assert operator._num_workers == 3
+
+    try:
+        asyncio.run(run())
+    finally:
+        release.set()
+
+
+def test_worker_idle_timeout(monkeypatch):
+    monkeypatch.setattr(ralf.operator, "WORKER_IDLE_TIMEOUT_S", 0.01)
+
+    async def run():
+        operator = Collect(num_worker_threads=2)
+        for record in make_records("ab", range(2)):
+            await operator._on_record(record)
+        assert operator._num_workers == 2
+        await wait_until(lambda: not operator._workers)
+        assert operator._num_workers == 0
+        assert operator._num_idle_workers == 0
+
+        # new events spawn workers again
+        await operator._on_record(make_records("c", [2])[0])
+        assert operator._num_workers == 1
+        await wait_until(lambda: not operator._workers)
+        return operator
+
+    operator = asyncio.run(run())
+    assert sorted(operator.seen) == [0, 1, 2]
+
+
+def test_worker_survives_errors():
+    calls = []
+
+    def flaky_prioritization(keys):
+        calls.append(keys)
+        if len(calls) == 1:
+            raise RuntimeError("policy failed")
+        if len(calls) == 2:
+            return "idle key"
+        return keys[-1]
+
+    class Failing(Collect):
+        def on_record(self, record) -> Optional[Record]:
+            super().on_record(record)
+            if record.value == 0:
+                raise RuntimeError("on_record failed")
+
+    async def run():
+        operator = Failing(num_worker_threads=1)
+        operator._intra_key_priortization = flaky_prioritization
+        for record in make_records("abcd", range(4)):
+            await operator._on_record(record)
+        await wait_until(lambda: len(operator.seen) == 4)
+        assert operator._num_workers == 1
+        assert len(operator._workers) == 1
+        return operator
+
+    operator = asyncio.run(run())
+    # falls back to the oldest key when the policy fails
+    assert operator.seen == [0, 1, 3, 2]
+    assert dict(operator._events) == {}
+
+
+def test_close():
+    pytest.importorskip("rocksdict")
+    from ralf.state import RocksDBTableState
+
+    operator = Collect(state_backend=RocksDBTableState)
+    child = make_child(1)
+    operator.set_children([child])
+    operator.set_send_batching(100, timeout_s=60)
+    operator.send(Record(key="a", value=1))
+    path = operator._table.path
+
+    operator.close()
+    # buffered records are sent, and the temporary table is removed
+    assert [len(batch) for batch in child.handles[0].batches] == [1]
+    assert not os.path.exists(path)
+
+
+def make_pool(num_shards: int, rendezvous_hashing: bool) -> ActorPool:
+    # Routing only depends on the number of handles, so skip creating actors.
+    pool = ActorPool.__new__(ActorPool)
+    pool.handles = list(range(num_shards))
+    pool.rendezvous_hashing = rendezvous_hashing
+    return pool
+
+
+@pytest.mark.parametrize("rendezvous_hashing", [False, True])
+def test_batch_routing_matches_shard_index(rendezvous_hashing):
+    pool = make_pool(5, rendezvous_hashing)
+    keys = ["a", "b", "a", 0, 3, -7, 2 ** 70, -(2 ** 70), 1.5] + [
+        str(i) for i in range(100)
+    ]
+    expected = [pool.shard_index(key) for key in keys]
+    assert pool.shard_indices(keys).tolist() == expected
+
+    groups = pool.group_by_shard(keys)
+    assert sorted(i for positions in groups.values() for i in positions) == list(
+        range(len(keys))
+    )
+    for shard_idx, positions in groups.items():
+        assert positions.tolist() == sorted(positions.tolist())
+        assert all(expected[i] == shard_idx for i in positions)
+
+    assert pool.group_by_shard([]) == {}
+
+
+class ShardRecorder:
+    """Stands in for a child shard's handle, recording the batches it receives."""
+
+    def __init__(self):
+        self.batches = []
+        self._on_records = SimpleNamespace(remote=self.batches.append)
+
+
+def make_child(num_shards: int) -> ActorPool:
+    child = make_pool(num_shards, rendezvous_hashing=False)
+    child.handles = [ShardRecorder() for _ in range(num_shards)]
+    child._lazy = False
+    return child
+
+
+def test_send_batching_batch_size():
+    operator = Collect()
+    child = make_child(2)
+    operator.set_children([child])
+    # long timeout, so only full batches are sent until flushed
+    operator.set_send_batching(3, timeout_s=60)
+
+    records = make_records([str(i % 5) for i in range(20)], range(20))
+    for record in records:
+        operator.send(record)
+
+    expected = [[], []]
+    for record in records:
+        expected[child.shard_index(record.key)].append(record.value)
+    for shard, values in zip(child.handles, expected):
+        assert [len(batch) for batch in shard.batches] == [3] * (len(values) // 3)
+
+    operator._flush_sends()
+    for shard, values in zip(child.handles, expected):
+        # records reach each shard in the order they were sent
+        assert [r.value for batch in shard.batches for r in batch] == values
+        assert all(0 < len(batch) <= 3 for batch in shard.batches)
+
+
+def test_send_batching_timeout():
+    operator = Collect()
+    child = make_child(1)
+    operator.set_children([child])
+    operator.set_send_batching(100, timeout_s=0.01)
+
+    records = make_records("ab", range(2))
+    for record in records:
+        operator.send(record)
+
+    shard = child.handles[0]
+    deadline = time.monotonic() + 5.0
+    while not shard.batches:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+    # the partial batch is flushed by the timer
+    assert shard.batches == [records]
+
+
+def test_send_many():
+    operator = Collect()
+    child = make_child(3)
+    operator.set_children([child])
+    records = make_records([str(i) for i in range(10)], range(10))
+
+    operator.send_many(records)
+    for shard_idx, shard in enumerate(child.handles):
+        # one call per shard, in send order
+        assert len(shard.batches) <= 1
+        assert [r.value for batch in shard.batches for r in batch] == [
+            r.value for r in records if child.shard_index(r.key) == shard_idx
+        ]
+    assert len(operator._table.bulk_query()) == 10
+
+    # overrides of send() still see every record
+    operator = Emit({})
+    operator.send_many(records)
+    assert operator.sent == records
+
+
+@pytest.mark.parametrize("operator_cls", [Emit, EmitSingle])
+def test_lineage_single_output(operator_cls):
+    operator = operator_cls({0: None, 1: Record(key="out", value=1)})
+
+    # operators returning None (e.g. sinks) record no lineage
+    operator._on_record_helper(Record(key="in", value=0))
+    assert operator.sent == []
+    assert dict(operator.key_to_parents) == {}
+
+    # re-emitting the same output doesn't duplicate lineage
+    for _ in range(3):
+        operator._on_record_helper(Record(key="in", value=1))
+    assert len(operator.sent) == 3
+    assert dict(operator.key_to_parents) == {"out": {"in"}}
+    assert dict(operator.parent_to_keys) == {"in": {"out"}}
+
+
+@pytest.mark.parametrize("operator_cls", [Emit, EmitList])
+def test_lineage_list_output(operator_cls):
+    outputs = [Record(key="a", value=1), Record(key="b", value=1)]
+    operator = operator_cls({0: None, 1: outputs})
+
+    operator._on_record_helper(Record(key="in", value=0))
+    for _ in range(2):
+        operator._on_record_helper(Record(key="in", value=1))
+    operator._on_record_helper(Record(key="other", value=1))
+
+    assert len(operator.sent) == 6
+    assert dict(operator.key_to_parents) == {
+        "a": {"in", "other"},
+        "b": {"in", "other"},
+    }
+    assert dict(operator.parent_to_keys) == {"in": {"a", "b"}, "other": {"a", "b"}}
+
+
+def test_get_many():
+    operator = Emit({})
+    operator._table.update(Record(key="a", value=1))
+
+    # missing keys are skipped
+    records = asyncio.run(operator.get_many(["a", "missing"]))
+    assert records == [Record(key="a", value=1)]
+
+    def broken_point_query(key):
+        raise RuntimeError("broken")
+
+    # other errors are not mistaken for missing keys
+    operator._table.point_query = broken_point_query
+    with pytest.raises(RuntimeError, match="broken"):
+        asyncio.run(operator.get_many(["a"]))
+
+
+class RecordingPool:
+    """Stands in for a child ActorPool, recording evictions and retractions."""
+
+    def __init__(self):
+        self.evicted = Counter()
+        self.retracted = []
+
+    def choose_actor(self, key):
+        return SimpleNamespace(
+            evict=SimpleNamespace(remote=self._evict),
+            retract=SimpleNamespace(remote=self._retract),
+        )
+
+    def _evict(self, key):
+        self.evicted[key] += 1
+
+    def _retract(self, orig_record, record=None):
+        self.retracted.append((orig_record, record))
+
+
+def test_delete_record_tree():
+    operator = Emit({})
+    child = RecordingPool()
+    operator._children = [child]
+    operator._cache_size = 10
+
+    # root -> {left, right} -> bottom (diamond), plus a cycle between
+    # bottom and loop, and an unrelated key.
+    for parent, derived in [
+        ("root", "left"),
+        ("root", "right"),
+        ("left", "bottom"),
+        ("right", "bottom"),
+        ("bottom", "loop"),
+        ("loop", "bottom"),
+        ("other", "unrelated"),
+    ]:
+        operator._add_lineage(Record(key=parent), Record(key=derived))
+    for key in ["root", "left", "right", "bottom", "loop", "unrelated"]:
+        operator._update_record(Record(key=key, value=0))
+
+    operator._delete_record_tree("root")
+
+    deleted = ["root", "left", "right", "bottom", "loop"]
+    assert child.evicted == Counter(deleted)
+    assert operator._table.bulk_query() == [Record(key="unrelated", value=0)]
+    assert list(operator._lru) == ["unrelated"]
+    assert dict(operator.key_to_parents) == {"unrelated": {"other"}}
+    assert dict(operator.parent_to_keys) == {"other": {"unrelated"}}
+
+
+class ParentPool:
+    """Stands in for a parent ActorPool, serving records from two shards."""
+
+    def __init__(self, records, failing=False):
+        self.records = records
+        self.failing = failing
+
+    def get_many_async(self, keys):
+        async def shard(records):
+            if self.failing:
+                raise RuntimeError("shard is down")
+            return [record for record in records if record.key in keys]
+
+        half = len(self.records) // 2
+        return [shard(self.records[:half]), shard(self.records[half:])]
+
+
+class Split(Operator):
+    def __init__(self):
+        super().__init__(Schema("key", {"value": int}))
+
+    def on_record(self, record) -> List[Record]:
+        return [
+            Record(key="low", value=record.value),
+            Record(key="high", value=record.value * 10),
+        ]
+
+    def send(self, record: Record):
+        self._update_record(record)
+
+
+def make_split(parent_records, failing=False):
+    operator = Split()
+    child = RecordingPool()
+    operator._children = [child]
+    operator._parents = [ParentPool(parent_records, failing)]
+    operator._on_record_helper(Record(key="kept", value=1))
+    operator._on_record_helper(Record(key="retracted", value=3))
+    return operator, child
+
+
+def test_retract_list_output():
+    operator, child = make_split([Record(key="kept", value=2)])
+
+    asyncio.run(operator.retract(Record(key="retracted", value=3)))
+
+    # recomputed from the remaining parent
+    assert operator._table.point_query("low") == Record(key="low", value=2)
+    assert operator._table.point_query("high") == Record(key="high", value=20)
+    assert sorted((orig.key, orig.value, new.value) for orig, new in child.retracted) == [
+        ("high", 30, 20),
+        ("low", 3, 2),
+    ]
+
+
+def test_retract_failed_parent():
+    operator, child = make_split([Record(key="kept", value=2)], failing=True)
+
+    asyncio.run(operator.retract(Record(key="retracted", value=3)))
+
+    # nothing is committed from partial inputs
+    assert operator._table.point_query("low") == Record(key="low", value=3)
+    assert operator._table.point_query("high") == Record(key="high", value=30)
+    assert child.retracted == []
+
+
+def test_retract_order_independent():
+    class Merge(Operator):
+        def __init__(self):
+            super().__init__(Schema("key", {"value": int}))
+
+        def on_record(self, record) -> Optional[Record]:
+            return Record(key="out", value=record.value)
+
+        def send(self, record: Record):
+            self._update_record(record)
+
+    # the most recently processed parent is served by the first shard
+    late, early = make_records("ba", [5, 7])
+    late.processing_time, early.processing_time = 2.0, 1.0
+    parents = [late, early]
+
+    for order in [parents, parents[::-1]]:
+        operator = Merge()
+        child = RecordingPool()
+        operator._children = [child]
+        operator._parents = [ParentPool(order)]
+        for record in make_records("abc", [7, 5, 9]):
+            operator._on_record_helper(record)
+
+        asyncio.run(operator.retract(Record(key="c", value=9)))
+
+        assert operator._table.point_query("out") == Record(key="out", value=5)
+        assert [new.value for _, new in child.retracted] == [5]
+        assert operator.on_records(order) == Record(key="out", value=5)
@@ -32,3 +32,12 @@ def test_custom():
     assert not custom_policy(a2, a0)
     assert custom_policy(a0, a1)
     assert custom_policy(a0, a2)
+
+
+def test_sort_keys():
+    first = Record(a=1)
+    second = Record(a=2)
+
+    for policy in [processing_policy.fifo, processing_policy.lifo]:
+        assert policy(first, second) == (policy.key(first) < policy.key(second))
+        assert policy(second, first) == (policy.key(second) < policy.key(first))
@@ -1,3 +1,6 @@
+import os
+
+import numpy as np
 import pytest
 
 from ralf.state import Record, Schema, TableState
@@ -46,3 +49,56 @@ def test_table_state():
     state.delete(key=2)
     with pytest.raises(KeyError, match="not found"):
         state.point_query(2)
+
+
+def test_rocksdb_table_state(tmp_path):
+    pytest.importorskip("rocksdict")
+    from ralf.state import RocksDBTableState
+
+    state = RocksDBTableState(
+        Schema(primary_key="key", columns={"a": str}), path=str(tmp_path / "db")
+    )
+    state.update(Record(key=1, a="a"))
+    with pytest.raises(AttributeError):
+        state.update(Record(no_primary_key=2))
+
+    assert state.point_query(key=1) == Record(a="a", key=1)
+    # keys that are equal as dict keys address the same record
+    assert state.point_query(key=1.0) == Record(a="a", key=1)
+    state.update(Record(key=np.int64(1), a="b"))
+    assert state.point_query(key=1).a == "b"
+    state.update(Record(key=np.float32(1.5), a="c"))
+    assert state.point_query(key=1.5).a == "c"
+    state.delete(key=1.5)
+    state.update(Record(key=1, a="a"))
+    with pytest.raises(KeyError, match="not found"):
+        state.point_query(1000)
+
+    state.update(Record(key=2, a="b"))
+    assert state.bulk_query() == [
+        Record(key=1, a="a"),
+        Record(key=2, a="b"),
+    ]
+
+    state.update(Record(key=2, a="c"))
+    assert state.point_query(2).a == "c"
+
+    state.delete(key=2)
+    with pytest.raises(KeyError, match="not found"):
+        state.point_query(2)
+
+    debug_state = state.debug_state()
+    assert debug_state["num_updates"] == 6
+    assert 0.0 <= debug_state["block_cache_hit_rate"] <= 1.0
+    state.close()
+
+
+def test_rocksdb_table_state_temporary_path():
+    pytest.importorskip("rocksdict")
+    from ralf.state import RocksDBTableState
+
+    state = RocksDBTableState(Schema(primary_key="key", columns={"a": str}))
+    state.update(Record(key=1, a="a"))
+    assert os.path.isdir(state.path)
+    state.close()
+    assert not os.path.exists(state.path)
@@ -9,7 +9,9 @@ setup(
     keywords=("feature store streaming machine learning python"),
     packages=find_packages(),
     install_requires=[
+        "numpy",
         "ray[serve]",
         "requests",
+        "xxhash",
     ],
 )